@@ -10,9 +10,19 @@ from llm_gemini import parse_request
 
 from planner import plan_3d_refine
 from exporters import export_kml, export_gpx, export_mavlink, plot_route_on_map
+from postprocess import postprocess_route, anchor_indices
+from obstacles import dissolve_obstacles, obstacle_hash
+from plan_cache import PlanCache, plan_key, intent_key
 # 在文件开头确保你 import 了 get_forbidden_zone
 from amap import geocode, route_driving, get_area_polygon, get_forbidden_zone, AMAP_KEY
 
+# 整体规划结果缓存（容量/有效期可通过环境变量调整）
+PLAN_CACHE = PlanCache(maxsize=int(os.getenv('PLAN_CACHE_SIZE', 128)),
+                       ttl=float(os.getenv('PLAN_CACHE_TTL', 3600)))
+# 一级缓存：解析意图 -> 已解析的起终点/障碍数/规划键，命中时跳过地理编码与禁飞区查询
+INTENT_CACHE = PlanCache(maxsize=int(os.getenv('INTENT_CACHE_SIZE', 256)),
+                         ttl=float(os.getenv('INTENT_CACHE_TTL', 600)))
+
 def handle_input(user_text):
     parsed = parse_request(user_text)
     print("Parsed request:", parsed)
@@ -27,6 +37,15 @@ def handle_input(user_text):
     if not origin_str or not destination_str:
         return {"error": "Could not parse origin/destination.", "parsed": parsed}, None
 
+    ikey = intent_key(origin_str, destination_str, constraints)
+    resolved = INTENT_CACHE.get(ikey)
+    if resolved is not None:
+        entry = PLAN_CACHE.get(resolved['plan_key'])
+        if entry is not None:
+            print(f"[handle_input] intent cache hit {ikey[:12]}")
+            return _respond(entry, resolved['origin'], resolved['destination'], constraints,
+                            resolved['obstacles_count'], hit=True)
+
     origin = geocode(origin_str)
     destination = geocode(destination_str)
 
@@ -73,23 +92,10 @@ def handle_input(user_text):
     if not origin or not destination:
         return {"error": "Geocoding failed", "origin": origin, "destination": destination}, None
 
-    route = route_driving(origin, destination)
-    if not route or 'polyline_points' not in route:
-        return {"error": "Amap routing failed"}, None
-
     combined_obstacles = []
     combined_obstacles.extend(obstacles)
     combined_obstacles.extend(no_fly_zones)
 
-    # --- 自适应缓冲重试：尝试一系列缓冲值，直到规划器找到避障路径 ---
-    # start with a conservative (较小) buffer set derived from constraints or defaults
-    initial_buffer = constraints.get('avoid_buffer_meters', 1000)
-    # 一系列尝试值（从大到小或从小到大都可以，这里从初始开始，然后递减）
-    try_buffers = [initial_buffer, max(1000, initial_buffer//2), max(500, initial_buffer//4), 250, 100]
-
-    refined = None
-    used_buffer = None
-        # ---------------- 在 handle_input 中，route 已拿到之后，替换掉原先 astar/refine 调用 ----------------
     # combined_obstacles 已合并 obstacles + no_fly_zones（每个是多边形 list）
     # 把它们规范为 polygon dict 或 list（planner 的函数支持 list-of-polys）
     polygons = []
@@ -99,6 +105,67 @@ def handle_input(user_text):
             polygons.append(p['poly'])
         elif isinstance(p, list) and len(p) >= 3:
             polygons.append(p)
+    # 合并重叠/包含的禁飞多边形并按缓冲距离简化边界（按障碍集合缓存）
+    polygons = dissolve_obstacles(polygons, buffer_meters=constraints.get('avoid_buffer_meters', 500))
+
+    # --- 整体规划缓存：键 = 规范化意图（地理编码后的起终点 + 约束）+ 障碍几何哈希 ---
+    key = plan_key(origin, destination, constraints, obstacle_hash(polygons))
+    entry, hit = PLAN_CACHE.get_or_compute(
+        key,
+        lambda: _plan_route(origin, destination, constraints, polygons, key),
+        should_cache=lambda e: 'error' not in e['result'],
+    )
+    if hit:
+        print(f"[handle_input] plan cache hit {key[:12]}")
+    if 'error' not in entry['result']:
+        INTENT_CACHE.put(ikey, {
+            'plan_key': key,
+            'origin': origin,
+            'destination': destination,
+            'obstacles_count': len(combined_obstacles),
+        })
+    return _respond(entry, origin, destination, constraints, len(combined_obstacles), hit)
+
+
+def _respond(entry, origin, destination, constraints, obstacles_count, hit):
+    """
+    Merge a (possibly cached) plan entry with the fields of the current request.
+    The cache holds only plan-dependent values; equivalent requests may differ
+    in place names / avoid wording.
+    """
+    if 'error' in entry['result']:
+        return entry['result'], entry['map']
+    result_json = {
+        "origin": origin,
+        "destination": destination,
+        "constraints": constraints,
+    }
+    result_json.update(entry['result'])
+    result_json["obstacles_count"] = obstacles_count
+    result_json["plan_cache_hit"] = hit
+    return result_json, entry['map']
+
+
+def _plan_route(origin, destination, constraints, polygons, key):
+    """
+    Driving route -> planning -> postprocess -> exports -> map.
+    Returns {'result': result_json, 'map': html} for PLAN_CACHE; exports are written
+    to per-plan files (named by the plan key) so cached paths stay valid.
+    Per-request fields (origin/destination/constraints/obstacles_count) are added by _respond.
+    """
+    route = route_driving(origin, destination)
+    if not route or 'polyline_points' not in route:
+        return {'result': {"error": "Amap routing failed"}, 'map': None}
+
+    # --- 自适应缓冲重试：尝试一系列缓冲值，直到规划器找到避障路径 ---
+    # start with a conservative (较小) buffer set derived from constraints or defaults
+    initial_buffer = constraints.get('avoid_buffer_meters', 1000)
+    # 一系列尝试值（从大到小或从小到大都可以，这里从初始开始，然后递减）
+    try_buffers = [initial_buffer, max(1000, initial_buffer//2), max(500, initial_buffer//4), 250, 100]
+
+    refined = None
+    used_buffer = None
+
     # 解析 must_pass / stopover（支持字符串或列表）
     must_pass_pts = []
     if 'must_pass' in constraints and constraints['must_pass']:
@@ -145,6 +212,42 @@ def handle_input(user_text):
     # call our simple planner: route_sequence_straight_skirt
     from planner import route_sequence_straight_skirt
     full2d = route_sequence_straight_skirt(seq, polygons, buffer_meters=buf)
+    planned_count = len(full2d)
+
+    # 航点抽稀/等距重采样（避免超出飞控任务航点上限），不会穿越禁飞多边形及其缓冲间隔
+    # LLM 可能返回 null / 非数字字符串，解析失败时回退默认值
+    waypoint_mode = constraints.get('waypoint_mode') or 'simplify'
+    if waypoint_mode not in ('simplify', 'resample', 'none'):
+        print(f"[handle_input] invalid waypoint_mode {waypoint_mode!r}, using 'simplify'")
+        waypoint_mode = 'simplify'
+    try:
+        waypoint_tol = float(constraints.get('waypoint_tolerance_meters', 5))
+        if not waypoint_tol >= 0:  # 也排除 nan
+            raise ValueError(waypoint_tol)
+    except Exception:
+        print(f"[handle_input] invalid waypoint_tolerance_meters {constraints.get('waypoint_tolerance_meters')!r}, using 5")
+        waypoint_tol = 5.0
+    try:
+        waypoint_spacing = float(constraints.get('waypoint_spacing_meters', 50))
+        if not waypoint_spacing > 0:  # 也排除 nan
+            raise ValueError(waypoint_spacing)
+    except Exception:
+        print(f"[handle_input] invalid waypoint_spacing_meters {constraints.get('waypoint_spacing_meters')!r}, using 50")
+        waypoint_spacing = 50.0
+    try:
+        clearance = float(buf)
+    except Exception:
+        clearance = 0.0
+    full2d = postprocess_route(
+        full2d,
+        mode=waypoint_mode,
+        tolerance_m=waypoint_tol,
+        spacing_m=waypoint_spacing,
+        obstacles=polygons,
+        clearance_m=clearance,
+        # 起点 / 必经点 / 经停点 / 终点 不可被抽稀或重采样移走
+        fixed=anchor_indices(full2d, seq),
+    )
 
     # attach altitude: use highlimit if provided, otherwise default flight altitude (e.g., 120m)
     try:
@@ -155,24 +258,22 @@ def handle_input(user_text):
 
     refined = [(lng, lat, flight_alt) for (lng, lat) in full2d]
 
-    # exports (unchanged)
-    kml_path = export_kml(refined, 'route_kml.kml')
-    gpx_path = export_gpx(refined, 'route_gpx.gpx')
-    mav_path = export_mavlink(refined, 'route_mavlink.mavlink')
+    # exports：按规划键命名，并发的不同规划不会互相覆盖
+    kml_path = export_kml(refined, f'route_{key[:12]}.kml')
+    gpx_path = export_gpx(refined, f'route_{key[:12]}.gpx')
+    mav_path = export_mavlink(refined, f'route_{key[:12]}.mavlink')
 
 
     result_json = {
-        "origin": origin,
-        "destination": destination,
-        "constraints": constraints,
         "amap_route_summary": {"points": len(route['polyline_points'])},
+        "planned_waypoints_count": planned_count,
         "refined_waypoints_count": len(refined),
         "refined_waypoints": refined,
         "kml": kml_path,
         "gpx": gpx_path,
         "mavlink": mav_path,
         "used_avoid_buffer_meters": used_buffer,
-        "obstacles_count": len(combined_obstacles)
+        "dissolved_obstacles_count": len(polygons)
     }
 
     # 可视化（和你原始代码一致）
@@ -183,10 +284,13 @@ def handle_input(user_text):
         refined_points=refined_2d,
         origin=origin,
         destination=destination,
-        no_fly_polygons=combined_obstacles
+        no_fly_polygons=polygons
     )
 
-    return result_json, route_map
+    return {
+        'result': result_json,
+        'map': route_map,
+    }
 
 
 
@@ -11,6 +11,10 @@ PARSER_PROMPT_CHINESE = """
 请严格以 JSON 格式返回，键名必须是 "origin", "destination", "constraints"。
 "constraints" 应为一个字典，包含所有找到的约束条件。
 如果信息缺失，请设置为空字符串或空字典。
+航点处理相关约束仅在用户明确提到时填写，否则省略该键：
+- "waypoint_mode"：只能是 "simplify"（抽稀，默认）、"resample"（按等间距重采样）或 "none"（不处理）
+- "waypoint_tolerance_meters"：抽稀容差，单位米，纯数字
+- "waypoint_spacing_meters"：重采样间距，单位米，纯数字
 用户指令：
 \"\"\"{user}\"\"\"
 请只返回 JSON 对象，不要包含任何其他解释性文字。
@@ -22,7 +26,10 @@ JSON 结构示例：
     "avoid": "需要避开的区域或条件",
     "must_pass": "必须经过的地点",
     "stopover": "中途停留点",
-    "highlimit": "高度限制"
+    "highlimit": "高度限制",
+    "waypoint_mode": "simplify | resample | none",
+    "waypoint_tolerance_meters": 5,
+    "waypoint_spacing_meters": 50
   }}
 }}
 """
@@ -0,0 +1,146 @@
+# obstacles.py -- obstacle preprocessing (dissolve / simplify) before planning
+import math
+import hashlib
+from functools import lru_cache
+
+from shapely.geometry import JOIN_STYLE, LineString, Polygon
+from shapely.ops import polygonize, split, unary_union
+
+M_PER_DEG_LAT = 111132.0
+
+# 简化容差 = buffer_meters * 比例（下限 1m）；简化后再向外扩 1 倍容差，保证结果覆盖原多边形
+SIMPLIFY_RATIO = 0.05
+MIN_TOLERANCE_M = 1.0
+# 坐标量化精度（约 1cm），用于缓存键及去重
+COORD_DECIMALS = 7
+
+
+def _obstacle_key(polygons):
+    """Order-independent, hashable key for a set of polygons."""
+    key = set()
+    for p in polygons or []:
+        if isinstance(p, dict):
+            p = p.get('poly')
+        if not p or len(p) < 3:
+            continue
+        key.add(tuple((round(float(q[0]), COORD_DECIMALS), round(float(q[1]), COORD_DECIMALS)) for q in p))
+    return tuple(sorted(key))
+
+
+def obstacle_hash(polygons):
+    """Stable digest of an obstacle set's geometry (order-independent)."""
+    return hashlib.sha1(repr(_obstacle_key(polygons)).encode('utf-8')).hexdigest()
+
+
+def _repair_ring(ring):
+    """
+    Self-intersecting ring -> every enclosed face of its noded boundary.
+    (buffer(0) would keep only one lobe of e.g. a bow-tie.)
+    """
+    closed = list(ring) if ring[0] == ring[-1] else list(ring) + [ring[0]]
+    faces = list(polygonize(unary_union(LineString(closed))))
+    return unary_union(faces) if faces else Polygon()
+
+
+def _split_holes(poly):
+    """
+    Polygon with holes -> hole-free pieces whose union is the polygon
+    (consumers take plain rings). Each hole is cut by a vertical line
+    through a point inside it, until no piece has interiors.
+    """
+    out = []
+    stack = [poly]
+    while stack:
+        p = stack.pop()
+        if not p.interiors:
+            out.append(p)
+            continue
+        x = Polygon(p.interiors[0]).representative_point().x
+        minx, miny, maxx, maxy = p.bounds
+        pieces = list(_iter_polygons(split(p, LineString([(x, miny - 1.0), (x, maxy + 1.0)]))))
+        if len(pieces) <= 1:
+            # 切割失败（数值退化）：保守地填洞
+            out.append(Polygon(p.exterior))
+            continue
+        stack.extend(pieces)
+    return out
+
+
+def _iter_polygons(geom):
+    if geom.is_empty:
+        return
+    if geom.geom_type == 'Polygon':
+        yield geom
+    elif hasattr(geom, 'geoms'):
+        for g in geom.geoms:
+            yield from _iter_polygons(g)
+
+
+@lru_cache(maxsize=64)
+def _dissolve_cached(key, buffer_meters):
+    shapes = []
+    for ring in key:
+        poly = Polygon(ring)
+        if not poly.is_valid:
+            # polyline_to_buffered_polygon 在急转弯处可能自相交，保留所有围合区域
+            poly = _repair_ring(ring)
+        if not poly.is_empty:
+            shapes.append(poly)
+    if not shapes:
+        return ()
+
+    # 合并重叠多边形；完全被包含的多边形在 union 中自然消失
+    merged = unary_union(shapes)
+
+    tol_m = max(MIN_TOLERANCE_M, float(buffer_meters) * SIMPLIFY_RATIO)
+    tol_deg = tol_m / M_PER_DEG_LAT
+    grown = []
+    for poly in _iter_polygons(merged):
+        # Douglas-Peucker 会使边界内缩至多 tol；向外扩 tol（斜接，不增加圆弧顶点）恢复覆盖。
+        # 内洞保留（起终点可能位于被禁飞区环绕的区域内），外扩只会让洞缩小 tol
+        simp = poly.simplify(tol_deg, preserve_topology=True).buffer(tol_deg, join_style=JOIN_STYLE.mitre)
+        if not simp.covers(poly):
+            simp = simp.union(poly)
+        grown.append(simp)
+
+    m2_per_deg2 = M_PER_DEG_LAT * M_PER_DEG_LAT * math.cos(math.radians(merged.centroid.y))
+    holes_in = [Polygon(r) for p in _iter_polygons(merged) for r in p.interiors]
+    out = []
+    kept = 0
+    for poly in _iter_polygons(unary_union(grown)):
+        holes = []
+        for ring in poly.interiors:
+            hole = Polygon(ring)
+            # 宽度不足 2*tol 的缝隙（如相邻行政区之间的细缝）填平
+            if not hole.buffer(-tol_deg).is_empty:
+                holes.append(ring)
+        kept += len(holes)
+        for piece in _split_holes(Polygon(poly.exterior, holes)):
+            coords = [(float(x), float(y)) for x, y in piece.exterior.coords]
+            if len(coords) >= 4:
+                out.append(tuple(coords))
+    if kept < len(holes_in):
+        dropped = sorted(holes_in, key=lambda h: h.area)[:len(holes_in) - kept]
+        print(f"[dissolve_obstacles] filled {len(dropped)} of {len(holes_in)} holes narrower than "
+              f"{2 * tol_m:.0f} m (largest ~{dropped[-1].area * m2_per_deg2:.0f} m2)")
+    return tuple(out)
+
+
+def dissolve_obstacles(polygons, buffer_meters=500):
+    """
+    Union overlapping obstacle polygons, drop fully contained ones and
+    simplify boundaries to a tolerance derived from buffer_meters.
+    polygons: list of polygons (list of (lng,lat)) or {'poly': [...]} dicts.
+    Returns list of polygons (each a closed list of (lng,lat)); holes of the
+    union are kept by splitting such polygons into hole-free pieces, only
+    sliver holes narrower than twice the tolerance are filled.
+    Results are cached per obstacle set (order-independent).
+    """
+    key = _obstacle_key(polygons)
+    if not key:
+        return []
+    res = _dissolve_cached(key, float(buffer_meters))
+    n_in = sum(len(r) for r in key)
+    n_out = sum(len(r) for r in res)
+    print(f"[dissolve_obstacles] {len(key)} polygons / {n_in} vertices -> {len(res)} polygons / {n_out} vertices")
+    return [list(r) for r in res]
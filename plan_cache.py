@@ -0,0 +1,162 @@
+# plan_cache.py -- whole-plan result cache (LRU + TTL + single-flight)
+import re
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 由障碍几何哈希完全代表的约束字段，不再参与意图键
+GEOMETRY_KEYS = ('avoid',)
+COORD_DECIMALS = 6
+# 地名列表拆分规则，与 app1.handle_input 一致
+NAME_SPLIT_RE = r'[，,、;；\s和]+'
+# 列表型约束 -> 是否与顺序无关（avoid 无序；must_pass / stopover 按访问顺序）
+NAME_LIST_KEYS = {'avoid': True, 'must_pass': False, 'stopover': False}
+NUMERIC_RE = re.compile(r'^[+-]?\d+(\.\d+)?$')
+
+
+def _normalize(v):
+    if isinstance(v, str):
+        v = re.sub(r'\s+', ' ', v.strip())
+        # "100" 与 100 视为相同
+        return float(v) if NUMERIC_RE.match(v) else v
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return float(v)
+    if isinstance(v, dict):
+        return {str(k).strip(): _normalize(x) for k, x in v.items() if x not in (None, '', [], {})}
+    if isinstance(v, (list, tuple)):
+        return [_normalize(x) for x in v if x not in (None, '')]
+    return v
+
+
+def _normalize_constraints(constraints):
+    """_normalize plus canonical name lists ("机场，公园" == "机场, 公园" == ["机场", "公园"])."""
+    cons = _normalize(constraints or {})
+    for k, unordered in NAME_LIST_KEYS.items():
+        v = cons.get(k)
+        if v is None:
+            continue
+        if isinstance(v, str):
+            names = [n for n in re.split(NAME_SPLIT_RE, v) if n]
+        elif isinstance(v, list):
+            names = [str(n).strip() for n in v if str(n).strip()]
+        else:
+            continue
+        if unordered:
+            names = sorted(set(names))
+        if names:
+            cons[k] = names
+        else:
+            cons.pop(k)
+    return cons
+
+
+def plan_key(origin, destination, constraints, obstacle_digest):
+    """
+    origin/destination: geocoded {'lng':..., 'lat':...}
+    constraints: parsed constraints dict
+    obstacle_digest: hash of the resolved obstacle geometry
+    Returns a hex digest; equivalent requests (same geocoded endpoints,
+    constraints and obstacles) map to the same key.
+    """
+    cons = _normalize_constraints(constraints)
+    for k in GEOMETRY_KEYS:
+        cons.pop(k, None)
+    intent = {
+        'origin': [round(float(origin['lng']), COORD_DECIMALS), round(float(origin['lat']), COORD_DECIMALS)],
+        'destination': [round(float(destination['lng']), COORD_DECIMALS), round(float(destination['lat']), COORD_DECIMALS)],
+        'constraints': cons,
+        'obstacles': obstacle_digest,
+    }
+    raw = json.dumps(intent, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def intent_key(origin, destination, constraints):
+    """
+    Cheap first-level key on the parsed request itself (place names, avoid
+    names, buffers), usable before any geocode / zone lookup. Within the
+    intent TTL a hit reuses the obstacle geometry resolved at first lookup.
+    """
+    intent = {
+        'origin': _normalize(origin),
+        'destination': _normalize(destination),
+        'constraints': _normalize_constraints(constraints),
+    }
+    raw = json.dumps(intent, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """
+    Bounded LRU cache with per-entry TTL and single-flight:
+    concurrent get_or_compute calls for the same key run compute() once,
+    the others wait for and share its result.
+    """
+
+    def __init__(self, maxsize=128, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._inflight = {}          # key -> threading.Event
+        self._lock = threading.Lock()
+
+    def _get_locked(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return copy.deepcopy(self._get_locked(key))
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_compute(self, key, compute, should_cache=None):
+        """
+        Returns (value, hit). Values are deep-copied on the way out so callers
+        cannot mutate the cached entry.
+        should_cache(value) -> bool, e.g. to skip caching error results.
+        """
+        while True:
+            with self._lock:
+                value = self._get_locked(key)
+                if value is not None:
+                    return copy.deepcopy(value), True
+                event = self._inflight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    leader = True
+                else:
+                    leader = False
+            if not leader:
+                # 等待同键的计算完成后重新查缓存；若其失败/不缓存，则由本线程接手计算
+                event.wait()
+                continue
+            try:
+                value = compute()
+                if should_cache is None or should_cache(value):
+                    self.put(key, value)
+                return copy.deepcopy(value), False
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
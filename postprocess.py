@@ -0,0 +1,262 @@
+# postprocess.py -- route post-processing (thinning / resampling) before export
+import math
+import numpy as np
+
+# 与 amap.circle_buffer 使用同一组经纬度 -> 米 换算常数
+M_PER_DEG_LAT = 111132.0
+M_PER_DEG_LON = 111320.0
+# 接触判定的数值容差（米）：经过多边形顶点或贴边的弦也视为穿越
+CONTACT_EPS_M = 1e-3
+
+
+# ---------------- projection helpers ----------------
+def _to_xy(lnglat, lat0):
+    """(N,2) lng/lat array -> (N,2) local metres (equirectangular around lat0)"""
+    xy = np.empty((len(lnglat), 2), dtype=float)
+    xy[:, 0] = lnglat[:, 0] * (M_PER_DEG_LON * math.cos(math.radians(lat0)))
+    xy[:, 1] = lnglat[:, 1] * M_PER_DEG_LAT
+    return xy
+
+
+def _obstacle_edges(obstacles, lat0):
+    """
+    obstacles: list of polygons (list of (lng,lat)) or {'poly': [...]} dicts.
+    Returns (M,4) array of edges [x0,y0,x1,y1] in local metres, or None.
+    """
+    edges = []
+    for p in obstacles or []:
+        if isinstance(p, dict):
+            p = p.get('poly')
+        if not p or len(p) < 3:
+            continue
+        ring = _to_xy(np.asarray([(q[0], q[1]) for q in p], dtype=float), lat0)
+        # 闭合多边形
+        closed = np.vstack([ring, ring[:1]])
+        edges.append(np.hstack([closed[:-1], closed[1:]]))
+    if not edges:
+        return None
+    return np.vstack(edges)
+
+
+def _point_seg_dist(px, py, ax, ay, bx, by):
+    """Vectorized distance from point(s) p to segment(s) a-b (metres)."""
+    vx, vy = bx - ax, by - ay
+    vv = vx * vx + vy * vy
+    t = np.where(vv > 0, ((px - ax) * vx + (py - ay) * vy) / np.where(vv > 0, vv, 1.0), 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * vx), py - (ay + t * vy))
+
+
+def _make_blocker(xy, obstacles, lat0, clearance_m=0.0):
+    """
+    Build blocked(i, j) -> True if the chord xy[i]->xy[j] crosses, touches
+    (through a vertex or along an edge) any obstacle edge, or passes closer
+    than clearance_m to one. Where the original path i..j already runs inside
+    that margin, the chord only has to keep the clearance the path had.
+    Edge bounding boxes (grown by clearance_m) are precomputed so each query
+    is a single vectorized pass over the edges.
+    """
+    edges = _obstacle_edges(obstacles, lat0)
+    if edges is None:
+        return lambda i, j: False
+    clearance_m = max(0.0, float(clearance_m or 0.0))
+    pad = clearance_m + CONTACT_EPS_M
+    ex0, ey0, ex1, ey1 = edges.T
+    exmin, exmax = np.minimum(ex0, ex1) - pad, np.maximum(ex0, ex1) + pad
+    eymin, eymax = np.minimum(ey0, ey1) - pad, np.maximum(ey0, ey1) + pad
+
+    vertex_clear = None
+    if clearance_m > 0:
+        # 各原始航点到最近障碍边的距离（截断到 clearance_m），按块计算控制内存
+        vertex_clear = np.empty(len(xy))
+        step = max(1, 2000000 // len(edges))
+        for s in range(0, len(xy), step):
+            px, py = xy[s:s + step, 0:1], xy[s:s + step, 1:2]
+            d = _point_seg_dist(px, py, ex0, ey0, ex1, ey1).min(axis=1)
+            vertex_clear[s:s + step] = np.minimum(d, clearance_m)
+
+    def blocked(i, j):
+        px, py = xy[i]
+        qx, qy = xy[j]
+        m = ((exmax >= min(px, qx)) & (exmin <= max(px, qx)) &
+             (eymax >= min(py, qy)) & (eymin <= max(py, qy)))
+        if not m.any():
+            return False
+        ax, ay, bx, by = ex0[m], ey0[m], ex1[m], ey1[m]
+        d1 = (qx - px) * (ay - py) - (qy - py) * (ax - px)
+        d2 = (qx - px) * (by - py) - (qy - py) * (bx - px)
+        d3 = (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+        d4 = (bx - ax) * (qy - ay) - (by - ay) * (qx - ax)
+        if np.any((d1 * d2 < 0) & (d3 * d4 < 0)):
+            return True
+        # 非严格相交时，两线段距离 = 四个端点到对方线段距离的最小值；
+        # 为 0 即接触（过顶点/共线贴边）
+        dist = np.minimum.reduce([
+            _point_seg_dist(px, py, ax, ay, bx, by),
+            _point_seg_dist(qx, qy, ax, ay, bx, by),
+            _point_seg_dist(ax, ay, px, py, qx, qy),
+            _point_seg_dist(bx, by, px, py, qx, qy),
+        ])
+        if np.any(dist <= CONTACT_EPS_M):
+            return True
+        if vertex_clear is None:
+            return False
+        # 弦进入规划器保留的缓冲间隔（且比被替换的原始路径更近）；恰好在间隔边界上（贴边绕行）不算
+        allowed = vertex_clear[i:j + 1].min()
+        return bool(np.any(dist < allowed - CONTACT_EPS_M))
+
+    return blocked
+
+
+def anchor_indices(waypoints, anchors):
+    """
+    Indices of anchors (origin / must_pass / stopover / destination, in visit
+    order) within waypoints: for each anchor the nearest vertex at or after
+    the previous anchor's index.
+    """
+    if not waypoints or not anchors:
+        return []
+    arr = np.asarray([(p[0], p[1]) for p in waypoints], dtype=float)
+    lat0 = float(arr[:, 1].mean())
+    xy = _to_xy(arr, lat0)
+    axy = _to_xy(np.asarray([(p[0], p[1]) for p in anchors], dtype=float), lat0)
+    out = []
+    start = 0
+    for ax, ay in axy:
+        d = np.hypot(xy[start:, 0] - ax, xy[start:, 1] - ay)
+        start += int(np.argmin(d))
+        out.append(start)
+    return out
+
+
+def _fixed_legs(n, fixed):
+    """Sorted unique fixed indices including 0 and n-1."""
+    idx = {0, n - 1}
+    idx.update(int(i) for i in (fixed or []) if 0 <= int(i) < n)
+    return sorted(idx)
+
+
+def _as_output(arr, idx=None):
+    rows = arr if idx is None else arr[idx]
+    return [tuple(float(v) for v in r) for r in rows]
+
+
+# ---------------- simplification ----------------
+def simplify_route(waypoints, tolerance_m=5.0, obstacles=None, clearance_m=0.0, fixed=None):
+    """
+    Douglas-Peucker thinning with a tolerance in metres.
+    waypoints: list of (lng, lat) or (lng, lat, alt); kept vertices are returned unchanged.
+    fixed: indices that are always kept (e.g. must_pass / stopover vertices).
+    A chord that would cut through or touch any obstacle polygon, or come closer
+    than clearance_m to it, is never accepted; the span is split further instead.
+    """
+    if not waypoints or len(waypoints) <= 2:
+        return list(waypoints or [])
+    arr = np.asarray(waypoints, dtype=float)
+    lat0 = float(arr[:, 1].mean())
+    xy = _to_xy(arr, lat0)
+    blocked = _make_blocker(xy, obstacles, lat0, clearance_m)
+
+    n = len(xy)
+    keep = np.zeros(n, dtype=bool)
+    legs = _fixed_legs(n, fixed)
+    keep[legs] = True
+    # 用显式栈代替递归，避免长航线时递归过深；固定点之间各自简化
+    stack = list(zip(legs[:-1], legs[1:]))
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a = xy[i]
+        ab = xy[j] - a
+        ap = xy[i + 1:j] - a
+        ab2 = float(ab @ ab)
+        if ab2 == 0.0:
+            d = np.hypot(ap[:, 0], ap[:, 1])
+        else:
+            # 点到线段距离（而非到直线），可处理折返段
+            t = np.clip((ap @ ab) / ab2, 0.0, 1.0)
+            diff = ap - t[:, None] * ab
+            d = np.hypot(diff[:, 0], diff[:, 1])
+        k = int(np.argmax(d))
+        if d[k] > tolerance_m or blocked(i, j):
+            mid = i + 1 + k
+            keep[mid] = True
+            stack.append((i, mid))
+            stack.append((mid, j))
+    return _as_output(arr, keep)
+
+
+# ---------------- resampling ----------------
+def resample_route(waypoints, spacing_m=50.0, obstacles=None, clearance_m=0.0, fixed=None):
+    """
+    Resample to (approximately) uniform spacing in metres along the path.
+    Altitude (if present) is interpolated linearly. Where a resampled chord
+    would cut a corner through an obstacle (or its clearance_m margin), the
+    original vertices of that corner are re-inserted.
+    fixed: indices that must stay exact sample points; each leg between
+    them is resampled separately.
+    """
+    if not waypoints or len(waypoints) < 2 or spacing_m <= 0:
+        return list(waypoints or [])
+    legs = _fixed_legs(len(waypoints), fixed)
+    if len(legs) > 2:
+        out = []
+        for a, b in zip(legs[:-1], legs[1:]):
+            leg = resample_route(waypoints[a:b + 1], spacing_m, obstacles, clearance_m)
+            # 相邻航段共享端点，去掉重复
+            out.extend(leg if not out else leg[1:])
+        return out
+    arr = np.asarray(waypoints, dtype=float)
+    lat0 = float(arr[:, 1].mean())
+    xy = _to_xy(arr, lat0)
+
+    seg = np.hypot(*np.diff(xy, axis=0).T)
+    # 去掉零长度段（重复点），否则 np.interp 的 xp 不严格递增
+    nz = np.concatenate([[True], seg > 0])
+    arr, xy = arr[nz], xy[nz]
+    if len(arr) < 2:
+        return _as_output(arr)
+    s = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))])
+    total = s[-1]
+
+    n_out = max(1, int(math.ceil(total / spacing_m)))
+    t = np.linspace(0.0, total, n_out + 1)
+    out = np.column_stack([np.interp(t, s, arr[:, c]) for c in range(arr.shape[1])])
+
+    if not obstacles:
+        return _as_output(out)
+
+    # 每个采样点所在的原始线段编号；跨越原始顶点的弦才可能切角
+    seg_idx = np.clip(np.searchsorted(s, t, side='right') - 1, 0, len(s) - 2)
+    out_xy = _to_xy(out, lat0)
+    blocked = _make_blocker(out_xy, obstacles, lat0, clearance_m)
+    rows = [out[0]]
+    for k in range(n_out):
+        lo, hi = seg_idx[k], seg_idx[k + 1]
+        if hi > lo and blocked(k, k + 1):
+            rows.extend(arr[lo + 1:hi + 1])
+        rows.append(out[k + 1])
+    return _as_output(np.asarray(rows))
+
+
+# ---------------- unified entry ----------------
+def postprocess_route(waypoints, mode='simplify', tolerance_m=5.0, spacing_m=50.0, obstacles=None,
+                      clearance_m=0.0, fixed=None):
+    """
+    mode: 'simplify' (Douglas-Peucker, tolerance_m) / 'resample' (uniform spacing_m) / 'none'
+    clearance_m: margin around obstacles that new chords must keep (the planner buffer)
+    fixed: waypoint indices kept exactly in either mode (visit-sequence anchors)
+    """
+    if mode == 'simplify':
+        res = simplify_route(waypoints, tolerance_m=tolerance_m, obstacles=obstacles, clearance_m=clearance_m,
+                             fixed=fixed)
+    elif mode == 'resample':
+        res = resample_route(waypoints, spacing_m=spacing_m, obstacles=obstacles, clearance_m=clearance_m,
+                             fixed=fixed)
+    elif mode in (None, '', 'none'):
+        return list(waypoints or [])
+    else:
+        raise ValueError(f"unknown postprocess mode: {mode}")
+    print(f"[postprocess_route] {mode}: {len(waypoints or [])} -> {len(res)} waypoints")
+    return res